@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import asyncio
+from typing import List, Optional
+from fastapi import FastAPI, File, Form, Header, HTTPException, UploadFile
+from fastapi.responses import FileResponse, StreamingResponse
+
+# Add src directory to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from schemas.state import PipelineState
+from compliance import DEFAULT_RULES
+from jobs import JobQueueFullError, reserve_job, release_job, submit_job, get_job, get_events
+from upload_store import store_upload, release_uploads
+
+SSE_POLL_INTERVAL = 0.5
+
+app = FastAPI(title="Expense Report API")
+
+def get_job_or_404(job_id):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown report job {job_id}")
+    return job
+
+def parse_compliance_rules(compliance_rules):
+    """Parses the compliance_rules form field, raising a 422 unless it is a JSON list of rules."""
+    try:
+        rules = json.loads(compliance_rules)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid compliance_rules JSON: {e}")
+
+    if not isinstance(rules, list):
+        raise HTTPException(status_code=422, detail="compliance_rules must be a JSON list of rules")
+    for idx, rule in enumerate(rules):
+        if not isinstance(rule, dict) or not {"rule_name", "value", "type"} <= rule.keys():
+            raise HTTPException(
+                status_code=422,
+                detail=f"compliance_rules[{idx}] must be an object with rule_name, value and type",
+            )
+    return rules
+
+@app.post("/reports", status_code=202)
+async def submit_report(
+    receipts: List[UploadFile] = File(...),
+    travel_start_date: Optional[str] = Form(None),
+    travel_end_date: Optional[str] = Form(None),
+    requester: Optional[str] = Form(""),
+    requester_department: Optional[str] = Form(""),
+    approver: Optional[str] = Form(""),
+    approver_department: Optional[str] = Form(""),
+    client: Optional[str] = Form(""),
+    project: Optional[str] = Form(""),
+    compliance_rules: Optional[str] = Form(None, description="JSON list of rules, defaults to company policy"),
+):
+    """Queues an expense report for processing and returns its job id."""
+    rules = parse_compliance_rules(compliance_rules) if compliance_rules else DEFAULT_RULES
+
+    # Claim the admission slot first, so a rejected report never writes its uploads
+    try:
+        job_id = await asyncio.to_thread(reserve_job)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "10"})
+
+    try:
+        receipt_paths = []
+        for receipt in receipts:
+            data = await receipt.read()
+            receipt_paths.append(await asyncio.to_thread(store_upload, data, receipt.filename, job_id))
+
+        state: PipelineState = {
+            "receipt_paths": receipt_paths,
+            "extracted_receipts": [],
+            "validated_receipts": [],
+            "expense_report_paths": [],
+            "compliance_rules": rules,
+            "travel_start_date": travel_start_date,
+            "travel_end_date": travel_end_date,
+            "requester": requester,
+            "requester_department": requester_department,
+            "approver": approver,
+            "approver_department": approver_department,
+            "client": client,
+            "project": project,
+        }
+
+        await asyncio.to_thread(submit_job, state, job_id)
+    except BaseException:
+        release_job(job_id)
+        release_uploads(job_id)
+        raise
+
+    return {
+        "job_id": job_id,
+        "status_url": f"/reports/{job_id}",
+        "events_url": f"/reports/{job_id}/events",
+    }
+
+@app.get("/reports/{job_id}")
+async def report_status(job_id: str):
+    """Returns a job's status and its results so far."""
+    job = await asyncio.to_thread(get_job_or_404, job_id)
+    job["artifacts"] = [
+        f"/reports/{job_id}/artifacts/{os.path.basename(path)}"
+        for path in job["result"].get("expense_report_paths", [])
+    ]
+    return job
+
+@app.get("/reports/{job_id}/events")
+async def report_events(
+    job_id: str,
+    after: int = 0,
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+):
+    """
+    Streams a job's progress events as Server-Sent Events until it finishes.
+    A reconnecting client resumes after its `Last-Event-ID`, which takes precedence over `after`.
+    """
+    await asyncio.to_thread(get_job_or_404, job_id)
+
+    async def stream():
+        last_id = last_event_id if last_event_id is not None else after
+        while True:
+            for event in await asyncio.to_thread(get_events, job_id, last_id):
+                last_id = event["id"]
+                yield f"id: {event['id']}\nevent: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+                if event["stage"] in ("done", "error"):
+                    return
+            await asyncio.sleep(SSE_POLL_INTERVAL)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/reports/{job_id}/artifacts/{filename}")
+async def report_artifact(job_id: str, filename: str):
+    """Downloads a generated Excel or PDF report."""
+    job = await asyncio.to_thread(get_job_or_404, job_id)
+    for path in job["result"].get("expense_report_paths", []):
+        if os.path.basename(path) == filename:
+            return FileResponse(path, filename=filename)
+    raise HTTPException(status_code=404, detail=f"No artifact {filename} for job {job_id}")
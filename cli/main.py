@@ -1,17 +1,50 @@
 import os
 import sys
 import json
+import asyncio
+import argparse
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
-from langgraph_pipeline import graph
+from workflows.expense_workflow import create_expense_workflow
+from ledger import query_receipts
+from compliance import DEFAULT_RULES
 
 def get_receipt_images(directory="images_test/"):
-    """Fetch all image files from the given directory."""
+    """Fetch all image and PDF receipts from the given directory."""
     return [
         os.path.join(directory, f) for f in os.listdir(directory)
-        if f.endswith((".jpg", ".png"))
+        if f.lower().endswith((".jpg", ".png", ".pdf"))
     ]
 
+def show_history(args):
+    """Print receipts from the ledger that match the given filters."""
+    receipts = query_receipts(
+        employee=args.employee,
+        merchant=args.merchant,
+        category=args.category,
+        start_date=args.start_date,
+        end_date=args.end_date,
+        limit=args.limit,
+    )
+    print(json.dumps(receipts, indent=4))
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expense report generator")
+    subparsers = parser.add_subparsers(dest="command")
+
+    history_parser = subparsers.add_parser("history", help="Query previously processed receipts")
+    history_parser.add_argument("--employee")
+    history_parser.add_argument("--merchant")
+    history_parser.add_argument("--category")
+    history_parser.add_argument("--start-date")
+    history_parser.add_argument("--end-date")
+    history_parser.add_argument("--limit", type=int, default=100)
+
+    args = parser.parse_args()
+
+    if args.command == "history":
+        show_history(args)
+        sys.exit(0)
+
     # Fetch receipt images
     receipt_images = get_receipt_images()
 
@@ -19,9 +52,9 @@ if __name__ == "__main__":
         print("No images found in the 'images/' folder.")
     else:
         # Run LangGraph pipeline with receipts
-        state = {"receipt_paths": receipt_images}
-        result = graph.invoke(state)
+        graph = create_expense_workflow()
+        state = {"receipt_paths": receipt_images, "compliance_rules": DEFAULT_RULES}
+        result = asyncio.run(graph.ainvoke(state))
 
         # Print structured OCR output
         print(json.dumps(result["extracted_receipts"], indent=4))
-
@@ -1,29 +1,58 @@
+import uuid
+import asyncio
 from typing import AsyncGenerator
+from langgraph.config import get_stream_writer
 from schemas.state import PipelineState
 from tools.ocr_tool import ocr_tool
 from tools.compliance_tool import compliance_tool
 from tools.report_tool import report_tool
+from tools.ledger_tool import duplicate_check_tool, ledger_tool
+from pdf_ingest import expand_receipt_paths
 
 async def processing_agent(state: PipelineState) -> AsyncGenerator[dict, None]:
     """Processes receipts by dynamically selecting the next tool to execute."""
 
+    # Per-receipt progress goes to the graph's custom stream, as only a node's final update reaches `astream`
+    writer = get_stream_writer()
+
     if not state.get("extracted_receipts"):
-        extracted_receipts = []
-        for path in state["receipt_paths"]:
-            receipt = await ocr_tool.ainvoke({"receipt_path": path})
-            if "error" not in receipt:
-                extracted_receipts.append(receipt)
+        receipt_paths = await asyncio.to_thread(expand_receipt_paths, state["receipt_paths"])
+        tasks = [asyncio.ensure_future(ocr_tool.ainvoke({"receipt_path": path})) for path in receipt_paths]
+        try:
+            for task in asyncio.as_completed(tasks):
+                writer({"extracted_receipt": await task, "receipt_count": len(tasks)})
+        finally:
+            # Don't leave the other receipts running unobserved if one of them failed the job
+            for task in tasks:
+                task.cancel()
+
+        # Keep the upload order, whatever order the receipts finished in
+        extracted_receipts = [task.result() for task in tasks if "error" not in task.result()]
 
         if extracted_receipts:
             state["extracted_receipts"] = extracted_receipts
             yield {"extracted_receipts": extracted_receipts}
 
     if not state.get("validated_receipts") and state.get("extracted_receipts"):
-        validated_receipts = await compliance_tool.ainvoke(
-            {"receipts": state["extracted_receipts"], "compliance_rules": state["compliance_rules"]}
-        )
+        tasks = [
+            asyncio.ensure_future(
+                compliance_tool.ainvoke({"receipts": [receipt], "compliance_rules": state["compliance_rules"]})
+            )
+            for receipt in state["extracted_receipts"]
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                writer({"validated_receipt": (await task)[0], "receipt_count": len(tasks)})
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        validated_receipts = [receipt for task in tasks for receipt in task.result()]
+        if validated_receipts:
+            validated_receipts = await duplicate_check_tool.ainvoke({"receipts": validated_receipts})
         if validated_receipts:
             state["validated_receipts"] = validated_receipts
+            writer({"validated_receipts": validated_receipts})
             yield {"validated_receipts": validated_receipts}
 
     if not state.get("expense_report_paths") and state.get("validated_receipts"):
@@ -31,21 +60,35 @@ async def processing_agent(state: PipelineState) -> AsyncGenerator[dict, None]:
         invalid_receipts = [r for r in state["validated_receipts"] if not r["is_compliant"]]
 
         if valid_receipts or invalid_receipts:
+            # The job id names both the artifacts and the ledger entry, so concurrent jobs never share either
+            report_id = state.get("report_id") or uuid.uuid4().hex
+            report_details = {
+                "travel_start_date": state.get("travel_start_date", "Not Provided"),
+                "travel_end_date": state.get("travel_end_date", "Not Provided"),
+                "requester": state.get("requester", ""),
+                "requester_department": state.get("requester_department", ""),
+                "approver": state.get("approver", ""),
+                "approver_department": state.get("approver_department", ""),
+                "client": state.get("client", ""),
+                "project": state.get("project", ""),
+            }
             report_paths = await report_tool.ainvoke(
                 {
+                    "report_id": report_id,
                     "valid_receipts": valid_receipts,
                     "invalid_receipts": invalid_receipts,
-                    "travel_start_date": state.get("travel_start_date", "Not Provided"),
-                    "travel_end_date": state.get("travel_end_date", "Not Provided"),
-                    "requester": state.get("requester", ""),
-                    "requester_department": state.get("requester_department", ""),
-                    "approver": state.get("approver", ""),
-                    "approver_department": state.get("approver_department", ""),
-                    "client": state.get("client", ""),
-                    "project": state.get("project", ""),
+                    **report_details,
                 }
             )
 
             if report_paths:
+                await ledger_tool.ainvoke(
+                    {
+                        "report_id": report_id,
+                        "receipts": state["validated_receipts"],
+                        "report_paths": report_paths,
+                        **report_details,
+                    }
+                )
                 state["expense_report_paths"] = report_paths
                 yield {"expense_report_paths": report_paths}
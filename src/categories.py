@@ -13,7 +13,6 @@ class Category(Enum):
         """
         Converts a string to a valid category enum, or defaults to OTHER.
         """
-        for category in cls:
-            if category.value.lower() == category_str.lower():
-                return category
-        return cls.OTHER
+        return _CATEGORIES_BY_NAME.get(category_str.strip().lower(), cls.OTHER)
+
+_CATEGORIES_BY_NAME = {category.value.lower(): category for category in Category}
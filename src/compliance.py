@@ -1,17 +1,27 @@
 import os
 import json
+import asyncio
 import datetime
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
+from inflight import InflightCalls
+from openai_transport import create_chat_completion
 
 load_dotenv()
 
-api_key = os.getenv('OPENAI_API_KEY')
-client = AsyncOpenAI(api_key=api_key)
+# Predefined Compliance Rules
+DEFAULT_RULES = [
+    {"rule_name": "Max Daily Meal Budget", "value": 70, "type": "Amount ($)"},
+    {"rule_name": "Individual Meals Receipt Approval Required Above", "value": 200, "type": "Amount ($)"},
+    {"rule_name": "Alcohol Limit Per Receipt", "value": 20, "type": "Percentage (%)"},
+    {"rule_name": "Tip Limit Per Receipt", "value": 20, "type": "Percentage (%)"},
+    {"rule_name": "Max Lodging Cost Per Night", "value": 250, "type": "Amount ($)"},
+    {"rule_name": "Airfare - Economy Required for Flights < 6 hrs", "value": True, "type": "Boolean"},
+    {"rule_name": "Rental Cars - No Luxury Vehicles Allowed", "value": True, "type": "Boolean"},
+]
 
-async def validate_receipts_with_llm(receipts, compliance_rules):
+async def validate_receipt_with_llm(receipt, compliance_rules):
     """
-    Validates structured receipts using an LLM against compliance rules and yields results incrementally.
+    Validates a single structured receipt using an LLM against compliance rules.
     """
 
     json_schema = {
@@ -35,50 +45,70 @@ async def validate_receipts_with_llm(receipts, compliance_rules):
         [f"- {rule['rule_name']}: {rule['value']} {rule['type']}" for rule in compliance_rules]
     )
 
-    for receipt in receipts:
-        instruction_prompt = f"""
-        You are a compliance officer reviewing business expense receipts.
-        Your task is to determine if the given receipt is compliant with company policy.
-
-        **Company Expense Rules:**
-        {rules}
-
-        **Receipt to Validate:**
-        Merchant: {receipt['merchant']}
-        Date: {receipt['date']}
-        Category: {receipt['category']}
-        Total Amount: ${receipt['total']:.2f}
-        Items:
-        {json.dumps(receipt['items'], indent=4)}
-
-        **Validation Rules:**
-        - Compare the total amount, alcohol amount, and tip against the policy limits PER RECEIPT.
-        - If any rules are violated, list the violations, but only list actual violations.
-        - If the receipt is compliant, return `is_compliant: true` and an empty list of violations.
-        """
-
-        PROMPT_MESSAGES = [
-            {"role": "system", "content": "You are a compliance officer reviewing business expenses."},
-            {"role": "user", "content": instruction_prompt},
-        ]
-
-        try:
-            response = await client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=PROMPT_MESSAGES,
-                response_format={"type": "json_schema", "json_schema": json_schema},
-                max_tokens=1000,
-                temperature=0.1,
-            )
-
-            structured_data = json.loads(response.choices[0].message.content)
-
-            receipt['is_compliant'] = structured_data['is_compliant']
-            receipt['violations'] = structured_data['violations']
-
-            yield {"validated_receipts": [receipt]}
-
-        except Exception as e:
-            receipt['is_compliant'] = False
-            receipt['violations'] = [f"Validation error: {str(e)}"]
-            yield {"validated_receipts": [receipt]}
\ No newline at end of file
+    instruction_prompt = f"""
+    You are a compliance officer reviewing business expense receipts.
+    Your task is to determine if the given receipt is compliant with company policy.
+
+    **Company Expense Rules:**
+    {rules}
+
+    **Receipt to Validate:**
+    Merchant: {receipt['merchant']}
+    Date: {receipt['date']}
+    Category: {receipt['category']}
+    Total Amount: ${receipt['total']:.2f}
+    Items:
+    {json.dumps(receipt['items'], indent=4)}
+
+    **Validation Rules:**
+    - Compare the total amount, alcohol amount, and tip against the policy limits PER RECEIPT.
+    - If any rules are violated, list the violations, but only list actual violations.
+    - If the receipt is compliant, return `is_compliant: true` and an empty list of violations.
+    """
+
+    PROMPT_MESSAGES = [
+        {"role": "system", "content": "You are a compliance officer reviewing business expenses."},
+        {"role": "user", "content": instruction_prompt},
+    ]
+
+    try:
+        structured_data = await compliance_calls.submit(instruction_prompt, PROMPT_MESSAGES, json_schema)
+
+        receipt['is_compliant'] = structured_data['is_compliant']
+        receipt['violations'] = structured_data['violations']
+
+    except Exception as e:
+        receipt['is_compliant'] = False
+        receipt['violations'] = [f"Validation error: {str(e)}"]
+
+    return receipt
+
+async def check_compliance(messages, json_schema):
+    """
+    Asks the model for a compliance verdict on a receipt prompt.
+    """
+    response = await create_chat_completion(
+        label="compliance",
+        model="gpt-4o-mini",
+        messages=messages,
+        response_format={"type": "json_schema", "json_schema": json_schema},
+        max_tokens=1000,
+        temperature=0.1,
+    )
+    return json.loads(response.choices[0].message.content)
+
+# Identical prompts (the same receipt under the same rules, e.g. a re-submitted report) share one call
+compliance_calls = InflightCalls(
+    check_compliance,
+    max_concurrent=int(os.getenv("COMPLIANCE_MAX_CONCURRENCY", "32")),
+)
+
+async def validate_receipts_with_llm(receipts, compliance_rules):
+    """
+    Validates structured receipts using an LLM against compliance rules and yields results incrementally.
+    Receipts are validated concurrently, sharing identical checks already in flight for other reports.
+    """
+    pending = [asyncio.ensure_future(validate_receipt_with_llm(receipt, compliance_rules)) for receipt in receipts]
+
+    for validation in pending:
+        yield {"validated_receipts": [await validation]}
\ No newline at end of file
@@ -0,0 +1,42 @@
+import copy
+import asyncio
+
+
+class InflightCalls:
+    """
+    Shares identical calls made by concurrent reports and bounds how many calls run at once.
+    Calls submitted under the same key while one is already in flight (the same receipt image, the same
+    compliance prompt) wait for that call instead of repeating it, and each caller gets its own copy of
+    the result. At most `max_concurrent` distinct calls run at a time.
+    """
+
+    def __init__(self, fn, max_concurrent=16):
+        self.fn = fn
+        self.max_concurrent = max_concurrent
+        self._loop = None
+        self._slots = None
+        self._inflight = {}
+
+    def _ensure_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+            self._inflight = {}
+
+    async def _run(self, args):
+        async with self._slots:
+            return await self.fn(*args)
+
+    async def submit(self, key, *args):
+        """Calls `fn(*args)`, or joins the call already in flight for `key`, and returns a copy of its result."""
+        self._ensure_loop()
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._loop.create_task(self._run(args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # A caller giving up must not cancel the call for the others sharing it
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result)
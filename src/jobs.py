@@ -0,0 +1,390 @@
+import os
+import json
+import uuid
+import sqlite3
+import asyncio
+import datetime
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from workflows.expense_workflow import create_expense_workflow
+from upload_store import release_uploads
+from pdf_ingest import expand_receipt_paths
+
+load_dotenv()
+
+JOBS_PATH = os.getenv("EXPENSE_JOBS_PATH", "output/jobs.sqlite3")
+MAX_CONCURRENT_JOBS = int(os.getenv("EXPENSE_MAX_CONCURRENT_JOBS", "4"))
+MAX_QUEUED_JOBS = int(os.getenv("EXPENSE_MAX_QUEUED_JOBS", "32"))
+HEARTBEAT_SECONDS = 10
+STALE_HEARTBEAT_SECONDS = 60
+
+# Identifies this process's worker among the processes (Streamlit, API) sharing the job store
+INSTANCE_ID = uuid.uuid4().hex
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total_receipts INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    error TEXT,
+    result TEXT,
+    owner TEXT,
+    heartbeat_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS job_events (
+    id INTEGER PRIMARY KEY,
+    job_id TEXT NOT NULL REFERENCES jobs(job_id) ON DELETE CASCADE,
+    created_at TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    message TEXT,
+    payload TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events(job_id, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+"""
+
+_initialized_paths = set()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+@contextmanager
+def connect(path=None):
+    """
+    Opens the job store, creating the schema on first use.
+    """
+    path = path or JOBS_PATH
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if path not in _initialized_paths:
+            conn.executescript(SCHEMA)
+            _migrate(conn)
+            _initialized_paths.add(path)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _migrate(conn):
+    """
+    Adds the columns introduced after a job store was created.
+    """
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    for column in ("owner", "heartbeat_at"):
+        if column not in columns:
+            try:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+            except sqlite3.OperationalError as e:
+                # Another process migrated the job store first
+                if "duplicate column" not in str(e):
+                    raise
+
+
+def record_event(job_id, stage, message, payload=None, status=None, result=None, error=None, total_receipts=None):
+    """
+    Appends a progress event to a job and optionally updates its status, result, error or receipt count.
+    """
+    now = _now()
+    with connect() as conn:
+        conn.execute(
+            "INSERT INTO job_events (job_id, created_at, stage, message, payload) VALUES (?, ?, ?, ?, ?)",
+            (job_id, now, stage, message, json.dumps(payload) if payload is not None else None),
+        )
+        conn.execute(
+            """
+            UPDATE jobs SET updated_at = ?,
+                            status = COALESCE(?, status),
+                            result = COALESCE(?, result),
+                            error = COALESCE(?, error),
+                            total_receipts = COALESCE(?, total_receipts)
+            WHERE job_id = ?
+            """,
+            (now, status, json.dumps(result) if result is not None else None, error, total_receipts, job_id),
+        )
+
+
+def get_job(job_id):
+    """
+    Returns a job's status and latest result, or None if the job is unknown.
+    """
+    with connect() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+    if row is None:
+        return None
+
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job["result"] else {}
+    return job
+
+
+def get_events(job_id, after_id=0):
+    """
+    Returns the events of a job recorded after the given event id, oldest first.
+    """
+    with connect() as conn:
+        rows = conn.execute(
+            "SELECT * FROM job_events WHERE job_id = ? AND id > ? ORDER BY id", (job_id, after_id)
+        ).fetchall()
+
+    events = []
+    for row in rows:
+        event = dict(row)
+        event["payload"] = json.loads(event["payload"]) if event["payload"] else None
+        events.append(event)
+    return events
+
+
+def heartbeat(owner=INSTANCE_ID):
+    """
+    Marks the unfinished jobs of a worker as still owned by a live process.
+    """
+    with connect() as conn:
+        conn.execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN ('queued', 'running')",
+            (_now(), owner),
+        )
+
+
+def fail_orphaned_jobs(owner=INSTANCE_ID):
+    """
+    Fails the unfinished jobs of other workers that stopped sending heartbeats, e.g. after a crash or restart.
+    """
+    cutoff = (datetime.datetime.now() - datetime.timedelta(seconds=STALE_HEARTBEAT_SECONDS)).isoformat(
+        timespec="seconds"
+    )
+    with connect() as conn:
+        orphaned = conn.execute(
+            "SELECT job_id FROM jobs WHERE status IN ('queued', 'running') "
+            "AND (owner IS NULL OR owner != ?) AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+            (owner, cutoff),
+        ).fetchall()
+
+    for row in orphaned:
+        record_event(row["job_id"], "error", "❌ Job interrupted: its worker process stopped",
+                     status="failed", error="interrupted")
+
+
+async def run_pipeline(job_id, state, graph):
+    """
+    Runs the expense workflow for a job, recording a progress event for each step and for every
+    receipt as it finishes OCR and compliance, with the receipts validated so far as the partial result.
+    """
+    # With PDF_PAGES_AS_RECEIPTS, each page of an uploaded PDF is a receipt of its own
+    state["receipt_paths"] = await asyncio.to_thread(expand_receipt_paths, state["receipt_paths"])
+    total_receipts = len(state["receipt_paths"])
+    processed_count = 0
+    result = {}
+
+    await asyncio.to_thread(
+        record_event, job_id, "started", f"🚀 Processing {total_receipts} receipt(s)",
+        status="running", total_receipts=total_receipts,
+    )
+
+    async for mode, chunk in graph.astream(state, stream_mode=["updates", "custom"]):
+        if mode == "custom":
+            if "extracted_receipt" in chunk:
+                processed_count += 1
+                if "error" not in chunk["extracted_receipt"]:
+                    result["extracted_count"] = result.get("extracted_count", 0) + 1
+                await asyncio.to_thread(
+                    record_event, job_id, "ocr",
+                    f"📄 Extracted {processed_count}/{total_receipts} receipts (OCR)",
+                    {"progress": processed_count / max(total_receipts, 1) * 0.5},
+                    result=result,
+                )
+
+            if "validated_receipt" in chunk:
+                result.setdefault("validated_receipts", []).append(chunk["validated_receipt"])
+                validated_count = len(result["validated_receipts"])
+                await asyncio.to_thread(
+                    record_event, job_id, "compliance",
+                    f"✅ Validated {validated_count}/{chunk['receipt_count']} receipts (Compliance)",
+                    {"progress": 0.5 + validated_count / max(chunk["receipt_count"], 1) * 0.25},
+                    result=result,
+                )
+
+            if "validated_receipts" in chunk:
+                # The complete list, in upload order and with duplicate violations added
+                result["validated_receipts"] = chunk["validated_receipts"]
+                await asyncio.to_thread(
+                    record_event, job_id, "compliance", "🔁 Checked receipts for duplicates",
+                    {"progress": 0.8}, result=result,
+                )
+            continue
+
+        processing = chunk.get("Processing") or {}
+        action = chunk.get("Action") or {}
+
+        if "expense_report_paths" in processing:
+            result["expense_report_paths"] = processing["expense_report_paths"]
+            await asyncio.to_thread(
+                record_event, job_id, "report", "📊 Expense reports generated", {"progress": 0.9}, result=result
+            )
+
+        if "email_status" in action:
+            email_status = action["email_status"]
+            if isinstance(email_status, dict):
+                email_status = email_status.get("email_status", "")
+            result["email_status"] = email_status
+            await asyncio.to_thread(record_event, job_id, "email", email_status, result=result)
+
+        if action.get("next_step") == "Done":
+            break
+
+    await asyncio.to_thread(
+        record_event, job_id, "done", "🎉 Processing complete! Download the report below.",
+        {"progress": 1.0}, status="done", result=result,
+    )
+
+
+class JobQueueFullError(Exception):
+    """Raised when a job is submitted while the admission queue is full."""
+
+
+class JobWorker:
+    """
+    Runs pipeline jobs on a dedicated event loop thread, at most `max_concurrent` at a time.
+    At most `max_queued` jobs may be admitted (running or waiting) before submissions are rejected.
+    Jobs are owned by the worker's process, which heartbeats them every HEARTBEAT_SECONDS; jobs whose owner
+    stopped heartbeating for STALE_HEARTBEAT_SECONDS are failed by the workers still running.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_JOBS, max_queued=MAX_QUEUED_JOBS):
+        self.loop = asyncio.new_event_loop()
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.pending = 0
+        self.reserved = set()
+        self.pending_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run_loop, name="expense-job-worker", daemon=True)
+        self.thread.start()
+        self.semaphore = asyncio.run_coroutine_threadsafe(self._make_semaphore(), self.loop).result()
+        self.graph = None
+        self.keep_alive = asyncio.run_coroutine_threadsafe(self._keep_alive(), self.loop)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _make_semaphore(self):
+        return asyncio.Semaphore(self.max_concurrent)
+
+    async def _keep_alive(self):
+        """Keeps this worker's jobs alive and fails the jobs of workers that went away."""
+        while True:
+            try:
+                await asyncio.to_thread(heartbeat)
+                await asyncio.to_thread(fail_orphaned_jobs)
+            except Exception as e:
+                print(f"Error updating job heartbeats: {e}")
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+
+    async def _run_job(self, job_id, state):
+        async with self.semaphore:
+            try:
+                if self.graph is None:
+                    self.graph = create_expense_workflow()
+                await run_pipeline(job_id, state, self.graph)
+            except Exception as e:
+                print(f"Error running job {job_id}: {e}")
+                await asyncio.to_thread(
+                    record_event, job_id, "error", f"❌ Processing failed: {e}", status="failed", error=str(e)
+                )
+            finally:
+                release_uploads(job_id)
+                self.release(job_id)
+
+    def reserve(self, job_id):
+        """Claims an admission slot for a job (once), raising JobQueueFullError when none is free."""
+        with self.pending_lock:
+            if job_id in self.reserved:
+                return
+            if self.pending >= self.max_queued:
+                raise JobQueueFullError(f"Too many reports in progress ({self.pending}), try again later.")
+            self.pending += 1
+            self.reserved.add(job_id)
+
+    def release(self, job_id):
+        with self.pending_lock:
+            if job_id in self.reserved:
+                self.reserved.discard(job_id)
+                self.pending -= 1
+
+    def submit(self, job_id, state):
+        return asyncio.run_coroutine_threadsafe(self._run_job(job_id, state), self.loop)
+
+
+def get_worker():
+    """
+    Returns the process-wide job worker, starting it on first use.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = JobWorker()
+        return _worker
+
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+def reserve_job():
+    """
+    Claims an admission slot for a job about to be submitted and returns its new job id, so nothing
+    (e.g. its uploads) is stored for a job that would be rejected.
+    Raises JobQueueFullError when the admission queue is full; call release_job if the job is never submitted.
+    """
+    job_id = new_job_id()
+    get_worker().reserve(job_id)
+    return job_id
+
+
+def release_job(job_id):
+    get_worker().release(job_id)
+
+
+def submit_job(state, job_id=None):
+    """
+    Queues a pipeline run for the given state and returns its job id immediately.
+    The job id is also the report id, naming the generated artifacts and the report's ledger entry.
+    Pass a `job_id` from `reserve_job()` (or `new_job_id()`) when the job's uploads were stored under it beforehand.
+    Raises JobQueueFullError when the admission queue is full.
+    """
+    worker = get_worker()
+    job_id = job_id or new_job_id()
+    state["report_id"] = job_id
+    now = _now()
+
+    worker.reserve(job_id)
+    try:
+        with connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, status, total_receipts, created_at, updated_at, owner, heartbeat_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, len(state["receipt_paths"]), now, now, INSTANCE_ID, now),
+            )
+        record_event(job_id, "queued", "⏳ Waiting for a free worker", {"progress": 0.0})
+    except Exception:
+        worker.release(job_id)
+        raise
+
+    worker.submit(job_id, state)
+    return job_id
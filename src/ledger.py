@@ -0,0 +1,555 @@
+import os
+import json
+import sqlite3
+import datetime
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LEDGER_PATH = os.getenv("EXPENSE_LEDGER_PATH", "output/ledger.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    report_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    travel_start_date TEXT,
+    travel_end_date TEXT,
+    requester TEXT,
+    requester_department TEXT,
+    approver TEXT,
+    approver_department TEXT,
+    client TEXT,
+    project TEXT,
+    report_paths TEXT
+);
+
+CREATE TABLE IF NOT EXISTS receipts (
+    id INTEGER PRIMARY KEY,
+    report_id TEXT NOT NULL REFERENCES reports(report_id) ON DELETE CASCADE,
+    image_hash TEXT NOT NULL,
+    receipt_id TEXT,
+    employee TEXT,
+    merchant TEXT,
+    date TEXT,
+    category TEXT,
+    total REAL,
+    alcohol_total REAL,
+    tip_amount REAL,
+    is_compliant INTEGER,
+    violations TEXT,
+    extraction_warnings TEXT,
+    processed_at TEXT NOT NULL,
+    UNIQUE (report_id, image_hash)
+);
+
+CREATE TABLE IF NOT EXISTS receipt_items (
+    receipt_pk INTEGER NOT NULL REFERENCES receipts(id) ON DELETE CASCADE,
+    name TEXT,
+    price REAL,
+    is_alcohol INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS merchants (
+    merchant_key TEXT PRIMARY KEY,
+    display_name TEXT NOT NULL,
+    seen_count INTEGER NOT NULL,
+    category_counts TEXT NOT NULL,
+    tip_count INTEGER NOT NULL,
+    alcohol_count INTEGER NOT NULL,
+    item_count_total INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+-- Spend and violation totals per report dimension and month, maintained incrementally by upsert_report
+CREATE TABLE IF NOT EXISTS spend_rollups (
+    department TEXT NOT NULL,
+    project TEXT NOT NULL,
+    client TEXT NOT NULL,
+    category TEXT NOT NULL,
+    month TEXT NOT NULL,
+    receipt_count INTEGER NOT NULL,
+    compliant_count INTEGER NOT NULL,
+    total_spend REAL NOT NULL,
+    PRIMARY KEY (department, project, client, category, month)
+);
+
+CREATE TABLE IF NOT EXISTS violation_rollups (
+    department TEXT NOT NULL,
+    project TEXT NOT NULL,
+    client TEXT NOT NULL,
+    month TEXT NOT NULL,
+    violation TEXT NOT NULL,
+    violation_count INTEGER NOT NULL,
+    PRIMARY KEY (department, project, client, month, violation)
+);
+
+CREATE INDEX IF NOT EXISTS idx_receipts_employee_date ON receipts(employee, date);
+CREATE INDEX IF NOT EXISTS idx_receipts_merchant_date ON receipts(merchant COLLATE NOCASE, date);
+CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts(date);
+CREATE INDEX IF NOT EXISTS idx_receipts_category_date ON receipts(category, date);
+CREATE INDEX IF NOT EXISTS idx_receipts_compliance_date ON receipts(is_compliant, date);
+CREATE INDEX IF NOT EXISTS idx_receipts_image_hash ON receipts(image_hash, processed_at);
+CREATE INDEX IF NOT EXISTS idx_reports_created_at ON reports(created_at);
+CREATE INDEX IF NOT EXISTS idx_receipt_items_receipt ON receipt_items(receipt_pk);
+CREATE INDEX IF NOT EXISTS idx_receipts_report ON receipts(report_id);
+CREATE INDEX IF NOT EXISTS idx_spend_rollups_month ON spend_rollups(month);
+CREATE INDEX IF NOT EXISTS idx_violation_rollups_month ON violation_rollups(month);
+"""
+
+ROLLUP_DIMENSIONS = ("department", "project", "client", "category", "month")
+
+# Rollup rows contributed by a set of receipts, keyed by the report's requester department, project and client
+SPEND_CONTRIBUTIONS = """
+SELECT COALESCE(p.requester_department, '') AS department, COALESCE(p.project, '') AS project,
+       COALESCE(p.client, '') AS client, COALESCE(r.category, 'Other') AS category,
+       COALESCE(substr(r.date, 1, 7), '') AS month,
+       COUNT(*) AS receipt_count, COALESCE(SUM(r.is_compliant), 0) AS compliant_count,
+       COALESCE(SUM(r.total), 0) AS total_spend
+FROM receipts r JOIN reports p ON p.report_id = r.report_id
+{where}
+GROUP BY 1, 2, 3, 4, 5
+"""
+
+VIOLATION_CONTRIBUTIONS = """
+SELECT COALESCE(p.requester_department, '') AS department, COALESCE(p.project, '') AS project,
+       COALESCE(p.client, '') AS client, COALESCE(substr(r.date, 1, 7), '') AS month,
+       v.value AS violation, COUNT(*) AS violation_count
+FROM receipts r JOIN reports p ON p.report_id = r.report_id, json_each(r.violations) v
+{where}
+GROUP BY 1, 2, 3, 4, 5
+"""
+
+_initialized_paths = set()
+
+RECEIPT_FIELDS = ("merchant", "date", "category", "total", "alcohol_total", "tip_amount")
+
+
+@contextmanager
+def connect(path=None):
+    """
+    Opens the ledger database, creating the schema on first use.
+    """
+    path = path or LEDGER_PATH
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        if path not in _initialized_paths:
+            conn.executescript(SCHEMA)
+            _migrate(conn)
+            with conn:
+                # Take the write lock before checking, so two processes opening the ledger cannot both backfill
+                conn.execute("BEGIN IMMEDIATE")
+                _backfill_rollups(conn)
+            _initialized_paths.add(path)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _migrate(conn):
+    """
+    Adds the columns introduced after a ledger was created.
+    """
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(receipts)")}
+    if "extraction_warnings" not in columns:
+        try:
+            conn.execute("ALTER TABLE receipts ADD COLUMN extraction_warnings TEXT")
+        except sqlite3.OperationalError as e:
+            # Another process migrated the ledger first
+            if "duplicate column" not in str(e):
+                raise
+
+
+def _apply_rollups(conn, sign, report_id=None):
+    """
+    Adds (sign=1) or removes (sign=-1) the rollup contributions of one report, or of every report.
+    """
+    where, params = ("WHERE r.report_id = ?", (report_id,)) if report_id else ("", ())
+
+    for row in conn.execute(SPEND_CONTRIBUTIONS.format(where=where), params).fetchall():
+        conn.execute(
+            """
+            INSERT INTO spend_rollups (department, project, client, category, month,
+                                       receipt_count, compliant_count, total_spend)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(department, project, client, category, month) DO UPDATE SET
+                receipt_count = receipt_count + excluded.receipt_count,
+                compliant_count = compliant_count + excluded.compliant_count,
+                total_spend = total_spend + excluded.total_spend
+            """,
+            (row["department"], row["project"], row["client"], row["category"], row["month"],
+             sign * row["receipt_count"], sign * row["compliant_count"], sign * row["total_spend"]),
+        )
+
+    for row in conn.execute(VIOLATION_CONTRIBUTIONS.format(where=where), params).fetchall():
+        conn.execute(
+            """
+            INSERT INTO violation_rollups (department, project, client, month, violation, violation_count)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(department, project, client, month, violation) DO UPDATE SET
+                violation_count = violation_count + excluded.violation_count
+            """,
+            (row["department"], row["project"], row["client"], row["month"], row["violation"],
+             sign * row["violation_count"]),
+        )
+
+    if sign < 0:
+        conn.execute("DELETE FROM spend_rollups WHERE receipt_count <= 0")
+        conn.execute("DELETE FROM violation_rollups WHERE violation_count <= 0")
+
+
+def _backfill_rollups(conn):
+    """
+    Builds the rollups from scratch for ledgers that recorded receipts before rollups existed.
+    """
+    if conn.execute("SELECT 1 FROM spend_rollups LIMIT 1").fetchone():
+        return
+    if conn.execute("SELECT 1 FROM receipts LIMIT 1").fetchone():
+        _apply_rollups(conn, 1)
+
+
+def _items_by_receipt(conn, receipt_pks):
+    """
+    Loads the items of several receipts in one query, grouped by receipt primary key.
+    """
+    items = {pk: [] for pk in receipt_pks}
+    if not receipt_pks:
+        return items
+
+    placeholders = ",".join("?" * len(receipt_pks))
+    rows = conn.execute(
+        f"SELECT receipt_pk, name, price, is_alcohol FROM receipt_items "
+        f"WHERE receipt_pk IN ({placeholders}) ORDER BY rowid",
+        list(receipt_pks),
+    )
+    for row in rows:
+        items[row["receipt_pk"]].append(
+            {"name": row["name"], "price": row["price"], "is_alcohol": bool(row["is_alcohol"])}
+        )
+    return items
+
+
+def _rows_to_receipts(conn, rows):
+    """
+    Converts receipt rows back into the dict shape used by the pipeline.
+    """
+    rows = list(rows)
+    items = _items_by_receipt(conn, [row["id"] for row in rows])
+
+    receipts = []
+    for row in rows:
+        receipt = {field: row[field] for field in RECEIPT_FIELDS}
+        receipt["receipt_id"] = row["receipt_id"]
+        receipt["image_hash"] = row["image_hash"]
+        receipt["report_id"] = row["report_id"]
+        receipt["employee"] = row["employee"]
+        receipt["items"] = items[row["id"]]
+        if row["is_compliant"] is not None:
+            receipt["is_compliant"] = bool(row["is_compliant"])
+            receipt["violations"] = json.loads(row["violations"] or "[]")
+        if row["extraction_warnings"]:
+            receipt["extraction_warnings"] = json.loads(row["extraction_warnings"])
+        receipts.append(receipt)
+    return receipts
+
+
+def upsert_report(report_id, receipts, user_inputs, report_paths=None, path=None):
+    """
+    Records a report and upserts its receipts and items into the ledger.
+    Receipts are keyed by (report_id, image_hash), so re-running a report replaces its rows; only the
+    first copy of an image submitted twice in the report is recorded.
+    The spend and violation rollups are updated in the same transaction: the report's previous
+    contribution (if any) is removed and its new one added.
+    """
+    now = datetime.datetime.now().isoformat(timespec="seconds")
+
+    with connect(path) as conn:
+        _apply_rollups(conn, -1, report_id)
+
+        conn.execute(
+            """
+            INSERT INTO reports (report_id, created_at, travel_start_date, travel_end_date, requester,
+                                 requester_department, approver, approver_department, client, project, report_paths)
+            VALUES (:report_id, :created_at, :travel_start_date, :travel_end_date, :requester,
+                    :requester_department, :approver, :approver_department, :client, :project, :report_paths)
+            ON CONFLICT(report_id) DO UPDATE SET
+                travel_start_date = excluded.travel_start_date,
+                travel_end_date = excluded.travel_end_date,
+                requester = excluded.requester,
+                requester_department = excluded.requester_department,
+                approver = excluded.approver,
+                approver_department = excluded.approver_department,
+                client = excluded.client,
+                project = excluded.project,
+                report_paths = excluded.report_paths
+            """,
+            {
+                "report_id": report_id,
+                "created_at": now,
+                "travel_start_date": user_inputs.get("travel_start_date"),
+                "travel_end_date": user_inputs.get("travel_end_date"),
+                "requester": user_inputs.get("requester"),
+                "requester_department": user_inputs.get("requester_department"),
+                "approver": user_inputs.get("approver"),
+                "approver_department": user_inputs.get("approver_department"),
+                "client": user_inputs.get("client"),
+                "project": user_inputs.get("project"),
+                "report_paths": json.dumps(list(report_paths or [])),
+            },
+        )
+
+        # Receipts dropped from the report since it was last recorded (their items cascade)
+        image_hashes = [receipt["image_hash"] for receipt in receipts if receipt.get("image_hash")]
+        placeholders = ",".join("?" * len(image_hashes))
+        conn.execute(
+            f"DELETE FROM receipts WHERE report_id = ? AND image_hash NOT IN ({placeholders})",
+            [report_id, *image_hashes],
+        )
+
+        recorded = set()
+        for receipt in receipts:
+            # A second copy of an image in the same report would overwrite the first copy's verdict
+            if not receipt.get("image_hash") or receipt["image_hash"] in recorded:
+                continue
+            recorded.add(receipt["image_hash"])
+
+            row = conn.execute(
+                """
+                INSERT INTO receipts (report_id, image_hash, receipt_id, employee, merchant, date, category, total,
+                                      alcohol_total, tip_amount, is_compliant, violations, extraction_warnings,
+                                      processed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(report_id, image_hash) DO UPDATE SET
+                    receipt_id = excluded.receipt_id,
+                    employee = excluded.employee,
+                    merchant = excluded.merchant,
+                    date = excluded.date,
+                    category = excluded.category,
+                    total = excluded.total,
+                    alcohol_total = excluded.alcohol_total,
+                    tip_amount = excluded.tip_amount,
+                    is_compliant = excluded.is_compliant,
+                    violations = excluded.violations,
+                    extraction_warnings = excluded.extraction_warnings,
+                    processed_at = excluded.processed_at
+                RETURNING id
+                """,
+                (
+                    report_id,
+                    receipt["image_hash"],
+                    receipt.get("receipt_id"),
+                    user_inputs.get("requester"),
+                    receipt.get("merchant"),
+                    receipt.get("date"),
+                    receipt.get("category"),
+                    receipt.get("total"),
+                    receipt.get("alcohol_total"),
+                    receipt.get("tip_amount"),
+                    None if "is_compliant" not in receipt else int(bool(receipt["is_compliant"])),
+                    json.dumps(receipt.get("violations", [])),
+                    json.dumps(receipt["extraction_warnings"]) if receipt.get("extraction_warnings") else None,
+                    now,
+                ),
+            ).fetchone()
+
+            conn.execute("DELETE FROM receipt_items WHERE receipt_pk = ?", (row["id"],))
+            conn.executemany(
+                "INSERT INTO receipt_items (receipt_pk, name, price, is_alcohol) VALUES (?, ?, ?, ?)",
+                [
+                    (row["id"], item.get("name"), item.get("price"), int(bool(item.get("is_alcohol"))))
+                    for item in receipt.get("items", [])
+                ],
+            )
+
+        _apply_rollups(conn, 1, report_id)
+
+
+def find_extraction(image_hash, path=None):
+    """
+    Returns the most recent clean extraction of an image (without compliance results), or None.
+    Lets the pipeline skip OCR for receipts that were already processed; extractions that failed
+    validation are not reused, so the receipt goes through the OCR cascade again.
+    """
+    with connect(path) as conn:
+        rows = conn.execute(
+            "SELECT * FROM receipts WHERE image_hash = ? AND extraction_warnings IS NULL "
+            "ORDER BY processed_at DESC LIMIT 1",
+            (image_hash,),
+        ).fetchall()
+        receipts = _rows_to_receipts(conn, rows)
+
+    if not receipts:
+        return None
+
+    receipt = receipts[0]
+    for key in ("report_id", "employee", "is_compliant", "violations"):
+        receipt.pop(key, None)
+    return receipt
+
+
+def find_duplicates(image_hashes, exclude_report_id=None, path=None):
+    """
+    Returns a mapping of image hash to the report ids that already contain that receipt.
+    """
+    image_hashes = list(image_hashes)
+    duplicates = {}
+    if not image_hashes:
+        return duplicates
+
+    placeholders = ",".join("?" * len(image_hashes))
+    query = f"SELECT DISTINCT image_hash, report_id FROM receipts WHERE image_hash IN ({placeholders})"
+    params = image_hashes
+    if exclude_report_id:
+        query += " AND report_id != ?"
+        params = image_hashes + [exclude_report_id]
+
+    with connect(path) as conn:
+        for row in conn.execute(query, params):
+            duplicates.setdefault(row["image_hash"], []).append(row["report_id"])
+    return duplicates
+
+
+def query_receipts(employee=None, merchant=None, category=None, is_compliant=None,
+                   start_date=None, end_date=None, limit=100, path=None):
+    """
+    Returns the most recent receipts matching the given filters, newest date first.
+    """
+    conditions, params = [], []
+    if employee:
+        conditions.append("employee = ?")
+        params.append(employee)
+    if merchant:
+        conditions.append("merchant = ? COLLATE NOCASE")
+        params.append(merchant)
+    if category:
+        conditions.append("category = ?")
+        params.append(category)
+    if is_compliant is not None:
+        conditions.append("is_compliant = ?")
+        params.append(int(bool(is_compliant)))
+    if start_date:
+        conditions.append("date >= ?")
+        params.append(start_date)
+    if end_date:
+        conditions.append("date <= ?")
+        params.append(end_date)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with connect(path) as conn:
+        rows = conn.execute(
+            f"SELECT * FROM receipts {where} ORDER BY date DESC, id DESC LIMIT ?",
+            params + [int(limit)],
+        ).fetchall()
+        return _rows_to_receipts(conn, rows)
+
+
+def list_reports(limit=50, path=None):
+    """
+    Returns the most recent reports with their header fields.
+    """
+    with connect(path) as conn:
+        rows = conn.execute(
+            "SELECT * FROM reports ORDER BY created_at DESC LIMIT ?", (int(limit),)
+        ).fetchall()
+
+    reports = []
+    for row in rows:
+        report = dict(row)
+        report["report_paths"] = json.loads(report["report_paths"] or "[]")
+        reports.append(report)
+    return reports
+
+
+def load_report(report_id, path=None):
+    """
+    Loads a stored report's header fields and receipts, or returns (None, []) if unknown.
+    """
+    with connect(path) as conn:
+        header = conn.execute("SELECT * FROM reports WHERE report_id = ?", (report_id,)).fetchone()
+        if header is None:
+            return None, []
+        rows = conn.execute(
+            "SELECT * FROM receipts WHERE report_id = ? ORDER BY id", (report_id,)
+        ).fetchall()
+        receipts = _rows_to_receipts(conn, rows)
+
+    header = dict(header)
+    header["report_paths"] = json.loads(header["report_paths"] or "[]")
+    return header, receipts
+
+
+def _rollup_filters(department=None, project=None, client=None, start_month=None, end_month=None):
+    conditions, params = [], []
+    for column, value in (("department", department), ("project", project), ("client", client)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    if start_month:
+        conditions.append("month >= ?")
+        params.append(start_month)
+    if end_month:
+        conditions.append("month <= ?")
+        params.append(end_month)
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+
+def query_spend(group_by=("category",), department=None, project=None, client=None,
+                start_month=None, end_month=None, path=None):
+    """
+    Returns spend totals across all reports grouped by any of ROLLUP_DIMENSIONS, largest spend first.
+    Months are `YYYY-MM`. Reads only the rollup tables, so the cost depends on the number of groups.
+    """
+    group_by = [dimension for dimension in group_by if dimension in ROLLUP_DIMENSIONS]
+    if not group_by:
+        raise ValueError(f"group_by must include at least one of {ROLLUP_DIMENSIONS}")
+
+    columns = ", ".join(group_by)
+    where, params = _rollup_filters(department, project, client, start_month, end_month)
+    with connect(path) as conn:
+        rows = conn.execute(
+            f"""
+            SELECT {columns}, SUM(receipt_count) AS receipt_count, SUM(compliant_count) AS compliant_count,
+                   SUM(receipt_count) - SUM(compliant_count) AS non_compliant_count, SUM(total_spend) AS total_spend
+            FROM spend_rollups {where}
+            GROUP BY {columns}
+            ORDER BY total_spend DESC
+            """,
+            params,
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def top_violations(limit=5, department=None, project=None, client=None,
+                   start_month=None, end_month=None, path=None):
+    """
+    Returns the most common violations across all reports as (violation, count) pairs.
+    """
+    where, params = _rollup_filters(department, project, client, start_month, end_month)
+    with connect(path) as conn:
+        rows = conn.execute(
+            f"""
+            SELECT violation, SUM(violation_count) AS violation_count FROM violation_rollups {where}
+            GROUP BY violation ORDER BY violation_count DESC LIMIT ?
+            """,
+            params + [int(limit)],
+        ).fetchall()
+    return [(row["violation"], row["violation_count"]) for row in rows]
+
+
+def rollup_dimension_values(dimension, path=None):
+    """
+    Returns the distinct values of a rollup dimension, for dashboard filters.
+    """
+    if dimension not in ROLLUP_DIMENSIONS:
+        raise ValueError(f"Unknown rollup dimension {dimension}")
+    with connect(path) as conn:
+        rows = conn.execute(f"SELECT DISTINCT {dimension} FROM spend_rollups ORDER BY 1").fetchall()
+    return [row[0] for row in rows]
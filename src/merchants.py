@@ -0,0 +1,188 @@
+import os
+import re
+import json
+import time
+import datetime
+import threading
+from collections import Counter
+from difflib import SequenceMatcher, get_close_matches
+from dotenv import load_dotenv
+from ledger import connect
+
+load_dotenv()
+
+MIN_MATCH_SCORE = 0.75
+# Only a (near) exact match is trusted with a merchant's category; weaker matches just guide extraction
+MIN_CATEGORY_MATCH_SCORE = 0.9
+MIN_SEEN_COUNT = int(os.getenv("MERCHANT_MIN_SEEN_COUNT", "3"))
+MIN_CATEGORY_SHARE = 0.8
+# How often merchants learned by other processes sharing the ledger (web app, API) are picked up
+REFRESH_SECONDS = 30
+
+# Tokens that say nothing about which merchant issued a receipt. Words naming a kind of business
+# ("hotel", "grill", "airlines") are kept, as they tell apart merchants sharing a brand name.
+STOP_TOKENS = {
+    "the", "and", "of", "at", "inc", "llc", "ltd", "co", "corp", "company", "no", "location",
+}
+
+
+def normalize_merchant(name):
+    """
+    Normalizes a merchant name to a lookup key: lowercase, no punctuation, store numbers or filler words.
+    Falls back to the plain lowercase name when nothing distinctive is left.
+    """
+    cleaned = re.sub(r"[^a-z0-9 ]+", " ", (name or "").lower().replace("&", " and "))
+    tokens = [t for t in cleaned.split() if not t.isdigit()]
+    distinctive = [t for t in tokens if t not in STOP_TOKENS]
+    return " ".join(distinctive or tokens)
+
+
+class MerchantIndex:
+    """
+    In-memory index of known merchants, loaded from the ledger and updated as receipts are learned.
+    The ledger is the source of truth: counts are incremented there, and merchants updated by other
+    processes are re-read every REFRESH_SECONDS.
+    Lookups try the normalized key first, then fuzzy-match candidates that share a token
+    (or, failing that, any key with a similar spelling), scoring each match.
+    """
+
+    def __init__(self):
+        self.merchants = {}
+        self.tokens = {}
+        self.refreshed_at = None
+        self.next_refresh = 0.0
+        self.lock = threading.Lock()
+
+    def _add(self, entry):
+        self.merchants[entry["merchant_key"]] = entry
+        for token in entry["merchant_key"].split():
+            self.tokens.setdefault(token, set()).add(entry["merchant_key"])
+
+    def _add_row(self, row):
+        entry = dict(row)
+        entry["category_counts"] = json.loads(entry["category_counts"])
+        self._add(entry)
+
+    def _load(self):
+        """
+        Loads the merchants updated since the last load (all of them the first time).
+        """
+        if time.monotonic() < self.next_refresh:
+            return
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        with connect() as conn:
+            if self.refreshed_at is None:
+                rows = conn.execute("SELECT * FROM merchants")
+            else:
+                rows = conn.execute("SELECT * FROM merchants WHERE updated_at >= ?", (self.refreshed_at,))
+            for row in rows:
+                self._add_row(row)
+        self.refreshed_at = now
+        self.next_refresh = time.monotonic() + REFRESH_SECONDS
+
+    def lookup(self, merchant_name):
+        """
+        Returns the known merchant entry that best matches the given name and its match score
+        (1.0 for the same normalized name), or (None, 0.0).
+        """
+        key = normalize_merchant(merchant_name)
+        if not key:
+            return None, 0.0
+
+        with self.lock:
+            self._load()
+            if key in self.merchants:
+                return self.merchants[key], 1.0
+
+            tokens = set(key.split())
+            candidates = set().union(*(self.tokens.get(token, set()) for token in tokens))
+            if not candidates:
+                # No shared token, e.g. an OCR typo: compare against every key
+                candidates = set(get_close_matches(key, self.merchants, n=3, cutoff=MIN_MATCH_SCORE))
+            best_entry, best_score = None, 0.0
+            for candidate in candidates:
+                candidate_tokens = set(candidate.split())
+                shared = len(tokens & candidate_tokens)
+                score = max(shared / len(tokens | candidate_tokens), SequenceMatcher(None, key, candidate).ratio())
+                if score > best_score:
+                    best_entry, best_score = self.merchants[candidate], score
+
+        return (best_entry, best_score) if best_score >= MIN_MATCH_SCORE else (None, 0.0)
+
+    def learn(self, receipts):
+        """
+        Records the merchant, category and layout of freshly extracted receipts.
+        """
+        updates = {}
+        for receipt in receipts:
+            key = normalize_merchant(receipt.get("merchant"))
+            if not key:
+                continue
+            update = updates.setdefault(
+                key, {"display_name": receipt["merchant"], "seen": 0, "categories": Counter(),
+                      "tips": 0, "alcohol": 0, "items": 0}
+            )
+            update["seen"] += 1
+            update["categories"][receipt.get("category", "Other")] += 1
+            update["tips"] += int(bool(receipt.get("tip_amount")))
+            update["alcohol"] += int(bool(receipt.get("alcohol_total")))
+            update["items"] += len(receipt.get("items", []))
+
+        if not updates:
+            return
+
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        with self.lock, connect() as conn:
+            # Hold the write lock while merging, so concurrent learners cannot lose each other's counts
+            conn.execute("BEGIN IMMEDIATE")
+            for key, update in updates.items():
+                row = conn.execute(
+                    "SELECT category_counts FROM merchants WHERE merchant_key = ?", (key,)
+                ).fetchone()
+                category_counts = Counter(json.loads(row["category_counts"]) if row else {}) + update["categories"]
+
+                row = conn.execute(
+                    """
+                    INSERT INTO merchants (merchant_key, display_name, seen_count, category_counts,
+                                           tip_count, alcohol_count, item_count_total, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(merchant_key) DO UPDATE SET
+                        seen_count = seen_count + excluded.seen_count,
+                        category_counts = excluded.category_counts,
+                        tip_count = tip_count + excluded.tip_count,
+                        alcohol_count = alcohol_count + excluded.alcohol_count,
+                        item_count_total = item_count_total + excluded.item_count_total,
+                        updated_at = excluded.updated_at
+                    RETURNING *
+                    """,
+                    (key, update["display_name"], update["seen"], json.dumps(dict(category_counts)),
+                     update["tips"], update["alcohol"], update["items"], now),
+                ).fetchone()
+                self._add_row(row)
+
+
+merchant_index = MerchantIndex()
+
+
+def known_category(entry, score):
+    """
+    Returns the category a matched merchant is reliably filed under, or None if the match is not close
+    enough or the merchant is not seen often enough.
+    """
+    if not entry or score < MIN_CATEGORY_MATCH_SCORE or entry["seen_count"] < MIN_SEEN_COUNT:
+        return None
+    category, count = Counter(entry["category_counts"]).most_common(1)[0]
+    return category if count / entry["seen_count"] >= MIN_CATEGORY_SHARE else None
+
+
+def layout_hints(entry):
+    """
+    Describes what a merchant's receipts usually look like, for use in an extraction prompt.
+    """
+    seen = entry["seen_count"]
+    hints = [f"Receipts from {entry['display_name']} usually list about {round(entry['item_count_total'] / seen)} item(s)."]
+    if entry["tip_count"] / seen >= 0.5:
+        hints.append("They usually include a tip line; make sure it is captured in `tip_amount`.")
+    if entry["alcohol_count"] / seen >= 0.5:
+        hints.append("They often include alcoholic drinks; flag them with `is_alcohol`.")
+    return " ".join(hints)
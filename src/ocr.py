@@ -2,23 +2,31 @@ import os
 import json
 import base64
 import asyncio
+import hashlib
+import datetime
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
 from categories import Category
+from ledger import find_extraction
+from upload_store import read_upload
+from inflight import InflightCalls
+from openai_transport import create_chat_completion
+from merchants import merchant_index, known_category, layout_hints
+from pdf_ingest import is_pdf, split_page_path, load_pdf_pages
 
 load_dotenv()
 
-api_key = os.getenv('OPENAI_API_KEY')
-client = AsyncOpenAI(api_key=api_key)
+OCR_MODEL = "gpt-4o-2024-08-06" # Cheaper for vision
+FAST_OCR_MODEL = os.getenv("OCR_FAST_MODEL", "gpt-4o-mini")
 
-async def extract_text_from_receipt(receipt_path):
-    """
-    Extracts structured text from a single receipt image using OpenAI Vision.
-    """
-    with open(receipt_path, "rb") as image:
-        base64_receipt = base64.b64encode(image.read()).decode("utf-8")
+# Extraction attempts as (model, image size); a receipt only moves on to the next one if it fails validation
+OCR_CASCADE = [
+    (FAST_OCR_MODEL, int(os.getenv("OCR_FAST_RESIZE", "768"))),
+    (OCR_MODEL, int(os.getenv("OCR_RESIZE", "1536"))),
+]
+
+AMOUNT_TOLERANCE = 0.05
 
-    json_schema = {
+RECEIPT_SCHEMA = {
     "name": "receipt_analysis",
     "strict": True,
     "schema": {
@@ -49,16 +57,18 @@ async def extract_text_from_receipt(receipt_path):
             "total": {"type": "number"},
             "alcohol_total": {"type": "number", "description": "Total amount spent on alcohol items"},
             "tip_amount": {"type": "number", "description": "Amount given as tip"},
+            "tax_amount": {"type": "number", "description": "Sales tax, VAT and other taxes charged"},
+            "fees_amount": {"type": "number", "description": "Service charges, surcharges and other fees that are not items"},
+            "discount_amount": {"type": "number", "description": "Discounts and coupons taken off, as a positive amount"},
             "receipt_id": {"type": "string"}
         },
-        "required": ["merchant", "date", "category", "items", "total", "alcohol_total", "tip_amount", "receipt_id"],
+        "required": ["merchant", "date", "category", "items", "total", "alcohol_total", "tip_amount",
+                     "tax_amount", "fees_amount", "discount_amount", "receipt_id"],
         "additionalProperties": False
     }
 }
 
-
-    prompt = [
-        f"""This is a receipt image. Extract the following details in structured JSON format:
+RECEIPT_PROMPT = """This is a receipt image. Extract the following details in structured JSON format:
         
         - **Merchant Name** (store or restaurant name)
         - **Date** must be it in the format: `"YYYY-MM-DD"` (e.g., `"2025-01-13"`) Do not use any other format.
@@ -67,38 +77,185 @@ async def extract_text_from_receipt(receipt_path):
             - Name of the item
             - Price of each item
             - Indicate if the item contains alcohol (`is_alcohol: true/false`)
-        - **Total Amount** spent (must match the sum of items + tip)
+        - **Total Amount** exactly as printed on the receipt (the final amount charged, including tip)
         - **Alcohol Total** (sum of all items where `is_alcohol` is `true`)
         - **Tip Amount** (only if explicitly mentioned on the receipt)
+        - **Tax Amount** (sales tax, VAT and any other taxes; 0 if none)
+        - **Fees Amount** (service charges, surcharges and other fees not listed as items; 0 if none)
+        - **Discount Amount** (discounts and coupons taken off, as a positive number; 0 if none)
 
-        Make sure `total` is correct by summing all items and the tip (if applies).
-        """,
-        {"image": base64_receipt, "resize": 1024}
-    ]
+        Copy every amount as printed; do not compute or correct `total` from the items.
+        """
 
+async def analyze_receipt(parts, prompt_text, json_schema, model, resize):
+    """
+    Sends a receipt's content to OpenAI and returns the structured JSON it extracted.
+    `parts` holds `{"image": base64}` page images and/or `{"text": ...}` PDF text layers;
+    text-only receipts need no Vision call at all.
+    """
+    prompt = [prompt_text]
+    for part in parts:
+        if "text" in part:
+            prompt.append(f"Text layer of a receipt page:\n{part['text']}")
+        else:
+            prompt.append({"image": part["image"], "resize": resize})
 
     PROMPT_MESSAGES = [
         {"role": "system", "content": "You are an OCR analyzer for receipts, extracting structured data."},
-        {"role": "user", "content": prompt},
+        {"role": "user", "content": prompt if any("image" in part for part in parts) else "\n\n".join(prompt)},
     ]
 
-    try:
-        response = await client.chat.completions.create(
-            # model="gpt-4o-mini",
-            model="gpt-4o-2024-08-06", # Cheaper for vision
-            messages=PROMPT_MESSAGES,
-            response_format={"type": "json_schema", "json_schema": json_schema},
-            max_tokens=1000,
-            temperature=0.4,
+    response = await create_chat_completion(
+        label="ocr",
+        model=model,
+        messages=PROMPT_MESSAGES,
+        response_format={"type": "json_schema", "json_schema": json_schema},
+        max_tokens=1000,
+        temperature=0.4,
+    )
+
+    return json.loads(response.choices[0].message.content)
+
+async def load_receipt_parts(receipt_path, data):
+    """
+    Converts a receipt file's contents into parts for analyze_receipt. Images become a single part;
+    PDFs (or one `#page=N` of them) use their text layer where present and rasterized pages otherwise.
+    """
+    if not is_pdf(receipt_path):
+        return [{"image": base64.b64encode(data).decode("utf-8")}]
+
+    parts = await load_pdf_pages(data, split_page_path(receipt_path)[1])
+    for part in parts:
+        if "image" in part:
+            part["image"] = base64.b64encode(part["image"]).decode("utf-8")
+    return parts
+
+def validate_extraction(receipt):
+    """
+    Checks an extraction for internal consistency and returns the list of problems found:
+    items + tax + fees + tip - discounts must add up to the total, alcohol_total must match the alcohol items,
+    and the date must parse.
+    """
+    problems = []
+    items = receipt.get("items", [])
+    total = receipt.get("total", 0.0)
+    tolerance = max(AMOUNT_TOLERANCE, abs(total) * 0.01)
+
+    charged_total = (
+        sum(item["price"] for item in items)
+        + receipt.get("tax_amount", 0.0)
+        + receipt.get("fees_amount", 0.0)
+        + receipt.get("tip_amount", 0.0)
+        - receipt.get("discount_amount", 0.0)
+    )
+    if abs(charged_total - total) > tolerance:
+        problems.append(
+            f"items + tax + fees + tip - discounts ({charged_total:.2f}) do not match total ({total:.2f})"
+        )
+
+    alcohol_total = sum(item["price"] for item in items if item["is_alcohol"])
+    if abs(alcohol_total - receipt.get("alcohol_total", 0.0)) > tolerance:
+        problems.append(
+            f"alcohol_total ({receipt.get('alcohol_total', 0.0):.2f}) does not match alcohol items ({alcohol_total:.2f})"
         )
 
-        structured_data = json.loads(response.choices[0].message.content)
-        structured_data["receipt_id"] = os.path.basename(receipt_path)
+    try:
+        datetime.datetime.strptime(receipt.get("date", ""), "%Y-%m-%d")
+    except ValueError:
+        problems.append(f"date {receipt.get('date')!r} is not in YYYY-MM-DD format")
+
+    return problems
+
+async def run_ocr_cascade(receipt_path, data):
+    """
+    Runs a receipt through OCR_CASCADE: a cheap, low-resolution pass first, escalating to the stronger
+    model at higher resolution only when the result fails validate_extraction.
+    Recognized merchants get their learned category, and their layout hints on later passes. An established
+    merchant's receipt that fails the cheap pass gets one more cheap pass with those hints before escalating,
+    so repeat merchants rarely need the stronger model.
+    """
+    try:
+        parts = await load_receipt_parts(receipt_path, data)
+    except Exception as e:
+        print(f"Error reading receipt {receipt_path}: {e}")
+        return {"error": f"Could not read receipt: {e}"}
+    if not parts:
+        return {"error": "No receipt content found (blank or boilerplate pages)"}
+
+    attempts = list(OCR_CASCADE)
+    structured_data, problems, merchant_entry, last_error, hinted_retry = None, [], None, None, False
+    while attempts:
+        model, resize = attempts.pop(0)
+        prompt_text = RECEIPT_PROMPT
+        if merchant_entry:
+            prompt_text += f"\n        Hint: {layout_hints(merchant_entry)}\n"
+
+        try:
+            structured_data = await analyze_receipt(parts, prompt_text, RECEIPT_SCHEMA, model, resize)
+        except Exception as e:
+            print(f"Error extracting text from receipt {receipt_path} with {model}: {e}")
+            last_error = e
+            continue
+
+        structured_data["ocr_model"] = model
         structured_data["category"] = Category.from_string(structured_data["category"]).value
-        
-        print(f"✅ Extracted structured data from receipt {structured_data}")
-        
+
+        merchant_entry, match_score = await asyncio.to_thread(merchant_index.lookup, structured_data["merchant"])
+        category = known_category(merchant_entry, match_score)
+        if category:
+            structured_data["category"] = category
+            structured_data["category_source"] = "merchant_index"
+
+        problems = validate_extraction(structured_data)
+        if not problems:
+            break
+        print(f"⚠️ Extraction of {receipt_path} with {model} failed validation: {'; '.join(problems)}")
+
+        # The usual layout (item count, tip line, alcohol) covers what a cheap pass typically misses
+        if category and not hinted_retry:
+            hinted_retry = True
+            attempts.insert(0, OCR_CASCADE[0])
+
+    if structured_data is None:
+        return {"error": str(last_error)}
+
+    if problems:
+        structured_data["extraction_warnings"] = problems
+    return structured_data
+
+ocr_calls = InflightCalls(run_ocr_cascade, max_concurrent=int(os.getenv("OCR_MAX_CONCURRENCY", "16")))
+
+async def extract_text_from_receipt(receipt_path, image_data=None):
+    """
+    Extracts structured text from a single receipt image or PDF using OpenAI Vision.
+    `image_data` (bytes or memoryview) skips reading the file from `receipt_path`.
+    Images already recorded in the ledger are returned from it without calling the model, and an image
+    already being extracted for another report shares that extraction.
+    """
+    file_path, page_number = split_page_path(receipt_path)
+    try:
+        data = image_data if image_data is not None else read_upload(file_path)
+    except OSError as e:
+        print(f"Error reading receipt {receipt_path}: {e}")
+        return {"error": f"Could not read receipt: {e}", "receipt_id": os.path.basename(receipt_path)}
+
+    image_hash = hashlib.sha256(data).hexdigest()
+    if page_number is not None:
+        image_hash = hashlib.sha256(f"{image_hash}#page={page_number + 1}".encode()).hexdigest()
+
+    cached_receipt = await asyncio.to_thread(find_extraction, image_hash)
+    if cached_receipt:
+        cached_receipt["receipt_id"] = os.path.basename(receipt_path)
+        print(f"♻️ Reusing ledger extraction for receipt {cached_receipt['receipt_id']}")
+        return cached_receipt
+
+    structured_data = await ocr_calls.submit(image_hash, receipt_path, data)
+    structured_data["receipt_id"] = os.path.basename(receipt_path)
+    if "error" in structured_data:
         return structured_data
-    except Exception as e:
-        print(f"Error extracting text from receipt {receipt_path}: {e}")
-        return {"error": str(e), "receipt_id": os.path.basename(receipt_path)}
\ No newline at end of file
+
+    structured_data["image_hash"] = image_hash
+
+    print(f"✅ Extracted structured data from receipt {structured_data}")
+
+    return structured_data
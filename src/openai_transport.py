@@ -0,0 +1,110 @@
+import os
+import time
+import asyncio
+import weakref
+from collections import deque
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+load_dotenv()
+
+api_key = os.getenv('OPENAI_API_KEY')
+
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "64"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "32"))
+KEEPALIVE_EXPIRY = 60.0
+DEFAULT_DEADLINE = float(os.getenv("OPENAI_DEADLINE_SECONDS", "60"))
+HEDGE_REQUESTS = os.getenv("OPENAI_HEDGE_REQUESTS", "false").lower() == "true"
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+# httpx connections belong to the event loop that opened them, so each loop gets its own pooled client
+_clients = weakref.WeakKeyDictionary()
+_latencies = {}
+
+
+def get_client():
+    """
+    Returns the shared AsyncOpenAI client for the running event loop, creating its connection pool on first use.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(DEFAULT_DEADLINE, connect=10.0),
+        )
+        client = AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=2)
+        _clients[loop] = client
+    return client
+
+
+def hedge_delay(key):
+    """
+    Returns the recent p95 latency of a kind of call, after which it gets a hedged duplicate, or None
+    while there are too few samples to tell.
+    """
+    samples = _latencies.get(key)
+    if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * HEDGE_PERCENTILE), len(ordered) - 1)]
+
+
+def _record_latency(key, seconds):
+    _latencies.setdefault(key, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+
+async def _hedged_call(delay, **kwargs):
+    """
+    Starts a call and, if it has not finished after `delay` seconds, fires a duplicate.
+    The first successful response wins and the other request is cancelled.
+    """
+    client = get_client()
+    primary = asyncio.ensure_future(client.chat.completions.create(**kwargs))
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            tasks.add(asyncio.ensure_future(client.chat.completions.create(**kwargs)))
+
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+        # Every attempt failed: surface the primary's error
+        return primary.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def create_chat_completion(label="chat", deadline=DEFAULT_DEADLINE, hedge=HEDGE_REQUESTS, **kwargs):
+    """
+    Calls chat.completions.create on the shared pooled client within `deadline` seconds, hedging calls
+    that run longer than the recent p95 latency of calls with the same `label` and model.
+    The latency sample is the whole call as the caller sees it, from the first attempt to the response
+    (or to the deadline when it times out), so hedging never hides the slow calls it reacts to.
+    """
+    key = f"{label}:{kwargs['model']}"
+    delay = hedge_delay(key) if hedge else None
+    call = get_client().chat.completions.create(**kwargs) if delay is None else _hedged_call(delay, **kwargs)
+
+    started = time.monotonic()
+    try:
+        response = await asyncio.wait_for(call, deadline)
+    except asyncio.TimeoutError:
+        _record_latency(key, time.monotonic() - started)
+        raise
+    _record_latency(key, time.monotonic() - started)
+    return response
@@ -0,0 +1,143 @@
+import os
+import re
+import atexit
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pymupdf
+from dotenv import load_dotenv
+from upload_store import read_upload
+
+load_dotenv()
+
+RASTER_DPI = int(os.getenv("PDF_RASTER_DPI", "150"))
+PDF_PAGES_AS_RECEIPTS = os.getenv("PDF_PAGES_AS_RECEIPTS", "false").lower() == "true"
+MIN_TEXT_LAYER_CHARS = 40
+BLANK_INK_RATIO = 0.002
+RASTER_WORKERS = os.cpu_count() or 1
+
+# A page listing no amount at all (terms & conditions, loyalty ads, ...) is not part of the receipt
+AMOUNT_PATTERN = re.compile(r"\d+[.,]\d{2}\b")
+PAGE_SUFFIX = re.compile(r"#page=(\d+)$")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def is_pdf(receipt_path):
+    return PAGE_SUFFIX.sub("", receipt_path).lower().endswith(".pdf")
+
+
+def split_page_path(receipt_path):
+    """
+    Splits a `file.pdf#page=N` path into (file path, zero-based page number or None).
+    """
+    match = PAGE_SUFFIX.search(receipt_path)
+    if not match:
+        return receipt_path, None
+    return receipt_path[:match.start()], int(match.group(1)) - 1
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Workers are spawned rather than forked: the pool is first used from multi-threaded job workers,
+            # and a forked child would inherit their locks in whatever state they happened to be
+            _pool = ProcessPoolExecutor(max_workers=RASTER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_pool.shutdown, cancel_futures=True)
+        return _pool
+
+
+def _rasterize_pages(pdf_bytes, page_numbers, dpi):
+    """
+    Renders several pages to PNG in a worker process, returning None in place of blank pages.
+    """
+    images = []
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as document:
+        for page_number in page_numbers:
+            page = document[page_number]
+
+            preview = page.get_pixmap(dpi=36, colorspace=pymupdf.csGRAY)
+            ink = sum(1 for value in preview.samples if value < 200)
+            if ink / max(len(preview.samples), 1) < BLANK_INK_RATIO:
+                images.append(None)
+                continue
+
+            images.append(page.get_pixmap(dpi=dpi).tobytes("png"))
+    return images
+
+
+def page_count(pdf_bytes):
+    with pymupdf.open(stream=bytes(pdf_bytes), filetype="pdf") as document:
+        return document.page_count
+
+
+def _read_text_layers(pdf_bytes, page_number=None):
+    """
+    Returns the usable text layers of a PDF's pages by page number, and the scanned pages needing rasterization.
+    """
+    parts = {}
+    scanned_pages = []
+
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as document:
+        page_numbers = range(document.page_count) if page_number is None else [page_number]
+        for number in page_numbers:
+            text = document[number].get_text().strip()
+            if len(text) >= MIN_TEXT_LAYER_CHARS:
+                if AMOUNT_PATTERN.search(text):
+                    parts[number] = {"text": text}
+            else:
+                scanned_pages.append(number)
+
+    return parts, scanned_pages
+
+
+async def load_pdf_pages(pdf_bytes, page_number=None):
+    """
+    Returns the receipt content of a PDF (or of one page of it) as a list of parts:
+    `{"text": ...}` for pages with a usable text layer, `{"image": png_bytes}` for scanned pages,
+    which are rasterized in parallel in a process pool. Blank and boilerplate pages are skipped.
+    Scanned pages are split into one share per worker, so the PDF is sent to each worker at most once.
+    """
+    pdf_bytes = bytes(pdf_bytes)
+    # Parsing a large PDF would stall every other job sharing the event loop
+    parts, scanned_pages = await asyncio.to_thread(_read_text_layers, pdf_bytes, page_number)
+
+    loop = asyncio.get_running_loop()
+    shares = [scanned_pages[start::RASTER_WORKERS] for start in range(min(len(scanned_pages), RASTER_WORKERS))]
+    images = await asyncio.gather(
+        *(loop.run_in_executor(_get_pool(), _rasterize_pages, pdf_bytes, share, RASTER_DPI) for share in shares)
+    )
+    for share, share_images in zip(shares, images):
+        for number, image in zip(share, share_images):
+            if image is not None:
+                parts[number] = {"image": image}
+
+    return [parts[number] for number in sorted(parts)]
+
+
+def expand_receipt_paths(receipt_paths):
+    """
+    When PDF_PAGES_AS_RECEIPTS is set, replaces each multi-page PDF with one `file.pdf#page=N` path per page,
+    so every page is processed as its own receipt. Otherwise a PDF is processed as one merged receipt.
+    """
+    if not PDF_PAGES_AS_RECEIPTS:
+        return list(receipt_paths)
+
+    expanded = []
+    for receipt_path in receipt_paths:
+        if not is_pdf(receipt_path) or split_page_path(receipt_path)[1] is not None:
+            expanded.append(receipt_path)
+            continue
+
+        try:
+            pages = page_count(read_upload(receipt_path))
+        except Exception as e:
+            # Unreadable (corrupt, encrypted) PDFs stay one receipt, which then fails on its own at OCR
+            print(f"Error counting the pages of {receipt_path}: {e}")
+            expanded.append(receipt_path)
+            continue
+        expanded.extend(f"{receipt_path}#page={number + 1}" for number in range(pages))
+    return expanded
@@ -1,6 +1,7 @@
 from typing import TypedDict, List, Optional
 
 class PipelineState(TypedDict):
+    report_id: Optional[str]
     receipt_paths: List[str]
     extracted_receipts: List[dict]
     validated_receipts: List[dict]
@@ -0,0 +1,75 @@
+import asyncio
+from typing import List, Optional
+from langchain.tools import tool
+from ledger import find_duplicates, upsert_report
+from merchants import merchant_index
+
+@tool
+async def duplicate_check_tool(receipts: List[dict]) -> List[dict]:
+    """Flags receipts whose image was already submitted in another report or earlier in this one."""
+    duplicates = await asyncio.to_thread(
+        find_duplicates, [r["image_hash"] for r in receipts if r.get("image_hash")]
+    )
+
+    seen = set()
+    for receipt in receipts:
+        image_hash = receipt.get("image_hash")
+        if not image_hash:
+            continue
+
+        previous_reports = duplicates.get(image_hash, [])
+        if previous_reports:
+            receipt["is_compliant"] = False
+            # The violation text is a stable label the dashboard can count; the reports go alongside it
+            receipt["duplicate_of"] = previous_reports
+            receipt.setdefault("violations", []).append("Duplicate receipt: already submitted in another report")
+        elif image_hash in seen:
+            receipt["is_compliant"] = False
+            receipt.setdefault("violations", []).append("Duplicate receipt: submitted more than once in this report")
+        seen.add(image_hash)
+
+    return receipts
+
+@tool
+async def ledger_tool(
+    report_id: str,
+    receipts: List[dict],
+    report_paths: List[str],
+    travel_start_date: Optional[str] = None,
+    travel_end_date: Optional[str] = None,
+    requester: Optional[str] = "",
+    requester_department: Optional[str] = "",
+    approver: Optional[str] = "",
+    approver_department: Optional[str] = "",
+    client: Optional[str] = "",
+    project: Optional[str] = "",
+) -> str:
+    """Records a generated report and its receipts in the persistent ledger and merchant index."""
+    await asyncio.to_thread(
+        upsert_report,
+        report_id,
+        receipts,
+        {
+            "travel_start_date": travel_start_date,
+            "travel_end_date": travel_end_date,
+            "requester": requester,
+            "requester_department": requester_department,
+            "approver": approver,
+            "approver_department": approver_department,
+            "client": client,
+            "project": project,
+        },
+        report_paths,
+    )
+
+    # Only learn from fresh, consistent extractions whose category came from the model, so merchants
+    # are never reinforced by their own pre-filled category
+    await asyncio.to_thread(
+        merchant_index.learn,
+        [
+            r for r in receipts
+            if r.get("ocr_model") and r.get("category_source") != "merchant_index" and not r.get("extraction_warnings")
+        ],
+    )
+
+    return report_id
@@ -1,10 +1,10 @@
-import datetime
 from typing import List, Optional, Dict
 from langchain.tools import tool
 from report_generator import generate_expense_report
 
 @tool
 def report_tool(
+    report_id: str,
     valid_receipts: List[dict], 
     invalid_receipts: List[dict], 
     travel_start_date: Optional[str] = "Not Provided",
@@ -18,8 +18,7 @@ def report_tool(
 ) -> List[str]:
     """Generates an Excel and PDF expense report with user-provided details."""
 
-    timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-    report_name = f"output/{timestamp}_expense_report"
+    report_name = f"output/{report_id}_expense_report"
     
     generate_expense_report(
         valid_receipts,
@@ -0,0 +1,91 @@
+import os
+import time
+import shutil
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+UPLOAD_DIR = os.getenv("EXPENSE_UPLOAD_DIR", "temp_uploads")
+UPLOAD_TTL_SECONDS = float(os.getenv("EXPENSE_UPLOAD_TTL_HOURS", "24")) * 3600
+GC_INTERVAL_SECONDS = 600
+
+# Buffers of uploads still being processed, so OCR can read them without going back to disk
+_buffers = {}
+_buffers_lock = threading.Lock()
+_last_gc = 0.0
+
+
+def store_upload(data, filename, namespace):
+    """
+    Stores an uploaded file under `<UPLOAD_DIR>/<namespace>/<sha256>/<filename>` and returns its path.
+    `data` may be bytes or a memoryview; it is hashed and written without being copied, and kept
+    in memory until the namespace is released.
+    """
+    collect_garbage()
+
+    data = memoryview(data)
+    content_hash = hashlib.sha256(data).hexdigest()
+    upload_dir = os.path.join(UPLOAD_DIR, namespace, content_hash)
+    # Nameless uploads are named after their content
+    path = os.path.join(upload_dir, os.path.basename(filename or "") or content_hash)
+
+    if not os.path.exists(path):
+        os.makedirs(upload_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    with _buffers_lock:
+        _buffers.setdefault(namespace, {})[path] = data
+
+    return path
+
+
+def read_upload(path):
+    """
+    Returns the contents of a stored upload, from memory when it is still held, otherwise from disk.
+    """
+    with _buffers_lock:
+        for buffers in _buffers.values():
+            if path in buffers:
+                return buffers[path]
+
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def release_uploads(namespace):
+    """
+    Drops the in-memory buffers of a namespace. Files stay on disk until they expire.
+    """
+    with _buffers_lock:
+        _buffers.pop(namespace, None)
+
+
+def collect_garbage(ttl_seconds=None, force=False):
+    """
+    Deletes upload namespaces that have not been modified within the TTL.
+    Runs at most once every GC_INTERVAL_SECONDS unless forced.
+    """
+    global _last_gc
+    now = time.time()
+    if not force and now - _last_gc < GC_INTERVAL_SECONDS:
+        return
+    _last_gc = now
+
+    if not os.path.isdir(UPLOAD_DIR):
+        return
+
+    ttl_seconds = UPLOAD_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    with _buffers_lock:
+        active = set(_buffers)
+
+    for namespace in os.listdir(UPLOAD_DIR):
+        namespace_dir = os.path.join(UPLOAD_DIR, namespace)
+        if namespace in active or not os.path.isdir(namespace_dir):
+            continue
+        if now - os.path.getmtime(namespace_dir) > ttl_seconds:
+            shutil.rmtree(namespace_dir, ignore_errors=True)
@@ -0,0 +1,84 @@
+import os
+import sys
+import tempfile
+import unittest
+
+# Add src directory to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from ledger import _apply_rollups, connect, upsert_report
+
+
+def receipt(image_hash, total, category="Meals", date="2025-01-13", violations=()):
+    return {
+        "image_hash": image_hash,
+        "merchant": f"Merchant {image_hash}",
+        "date": date,
+        "category": category,
+        "total": total,
+        "items": [{"name": "Item", "price": total, "is_alcohol": False}],
+        "is_compliant": not violations,
+        "violations": list(violations),
+    }
+
+
+class RollupTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "ledger.sqlite3")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def rollups(self):
+        with connect(self.path) as conn:
+            spend = conn.execute("SELECT * FROM spend_rollups ORDER BY 1, 2, 3, 4, 5").fetchall()
+            violations = conn.execute("SELECT * FROM violation_rollups ORDER BY 1, 2, 3, 4, 5").fetchall()
+        return [tuple(row) for row in spend], [tuple(row) for row in violations]
+
+    def rebuilt_rollups(self):
+        with connect(self.path) as conn:
+            conn.execute("DELETE FROM spend_rollups")
+            conn.execute("DELETE FROM violation_rollups")
+            _apply_rollups(conn, 1)
+        return self.rollups()
+
+    def test_rerecorded_report_matches_full_rebuild(self):
+        details = {"requester_department": "Sales", "project": "Apollo", "client": "Acme"}
+        upsert_report("report-a", [
+            receipt("a1", 40.0),
+            receipt("a2", 300.0, "Lodging", violations=["Lodging over nightly limit"]),
+            receipt("a3", 12.5, date="2025-02-02"),
+        ], details, path=self.path)
+        upsert_report("report-b", [
+            receipt("b1", 25.0, violations=["Tip over limit"]),
+        ], {**details, "project": "Gemini"}, path=self.path)
+
+        # Re-record report-a: one receipt dropped, one changed, one added, under another department
+        upsert_report("report-a", [
+            receipt("a1", 45.0, violations=["Tip over limit"]),
+            receipt("a2", 300.0, "Lodging", violations=["Lodging over nightly limit"]),
+            receipt("a4", 80.0, "Transportation", date="2025-02-10"),
+        ], {**details, "requester_department": "Marketing"}, path=self.path)
+
+        incremental = self.rollups()
+        self.assertEqual(incremental, self.rebuilt_rollups())
+
+        spend, violations = incremental
+        self.assertEqual(sum(row[5] for row in spend), 4)
+        self.assertAlmostEqual(sum(row[7] for row in spend), 450.0)
+        self.assertEqual(sum(row[5] for row in violations), 3)
+
+    def test_duplicate_copy_in_report_keeps_first_verdict(self):
+        upsert_report("report-a", [
+            receipt("a1", 40.0),
+            receipt("a1", 40.0, violations=["Duplicate receipt: submitted more than once in this report"]),
+        ], {}, path=self.path)
+
+        spend, violations = self.rollups()
+        self.assertEqual([(row[5], row[6]) for row in spend], [(1, 1)])
+        self.assertEqual(violations, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+
+# Add src directory to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from ocr import validate_extraction
+
+
+def receipt(**overrides):
+    extraction = {
+        "merchant": "Chick-fil-A",
+        "date": "2025-01-13",
+        "category": "Meals",
+        "items": [
+            {"name": "Chicken Sandwich", "price": 6.29, "is_alcohol": False},
+            {"name": "Waffle Fries", "price": 2.65, "is_alcohol": False},
+        ],
+        "total": 8.94,
+        "alcohol_total": 0.0,
+        "tip_amount": 0.0,
+        "tax_amount": 0.0,
+        "fees_amount": 0.0,
+        "discount_amount": 0.0,
+    }
+    extraction.update(overrides)
+    return extraction
+
+
+class ValidateExtractionTest(unittest.TestCase):
+    def test_untaxed_receipt_is_valid(self):
+        self.assertEqual(validate_extraction(receipt()), [])
+
+    def test_taxed_receipt_is_valid(self):
+        # 8.94 of items + 0.72 sales tax, as printed
+        self.assertEqual(validate_extraction(receipt(total=9.66, tax_amount=0.72)), [])
+
+    def test_taxed_receipt_with_tip_fees_and_discount_is_valid(self):
+        extraction = receipt(total=11.16, tax_amount=0.72, fees_amount=0.50, tip_amount=2.00, discount_amount=1.00)
+        self.assertEqual(validate_extraction(extraction), [])
+
+    def test_misread_total_is_flagged(self):
+        problems = validate_extraction(receipt(total=96.60, tax_amount=0.72))
+        self.assertEqual(len(problems), 1)
+        self.assertIn("do not match total", problems[0])
+
+    def test_bad_date_is_flagged(self):
+        problems = validate_extraction(receipt(date="01/13/2025"))
+        self.assertEqual(len(problems), 1)
+        self.assertIn("YYYY-MM-DD", problems[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
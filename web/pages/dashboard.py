@@ -0,0 +1,82 @@
+import os
+import sys
+import pandas as pd
+import streamlit as st
+
+# Add src directory to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from ledger import ROLLUP_DIMENSIONS, query_spend, top_violations, rollup_dimension_values
+
+def main():
+    st.title("📈 Spend Dashboard")
+    st.write("Spend and compliance across every processed expense report.")
+
+    # Filters
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        department = st.selectbox("🏢 Department", ["All"] + rollup_dimension_values("department"))
+    with col2:
+        project = st.selectbox("📂 Project", ["All"] + rollup_dimension_values("project"))
+    with col3:
+        client = st.selectbox("🏢 Client", ["All"] + rollup_dimension_values("client"))
+
+    months = rollup_dimension_values("month")
+    col1, col2 = st.columns(2)
+    with col1:
+        start_month = st.selectbox("📅 From Month", ["All"] + months)
+    with col2:
+        end_month = st.selectbox("📅 To Month", ["All"] + months)
+
+    group_by = st.multiselect("Group By", ROLLUP_DIMENSIONS, default=["category"])
+    if not group_by:
+        st.info("Select at least one field to group by.")
+        return
+
+    filters = {
+        "department": None if department == "All" else department,
+        "project": None if project == "All" else project,
+        "client": None if client == "All" else client,
+        "start_month": None if start_month == "All" else start_month,
+        "end_month": None if end_month == "All" else end_month,
+    }
+
+    spend = query_spend(group_by, **filters)
+    if not spend:
+        st.info("No receipts have been recorded yet.")
+        return
+
+    # Summary
+    total_spend = sum(row["total_spend"] for row in spend)
+    total_receipts = sum(row["receipt_count"] for row in spend)
+    total_non_compliant = sum(row["non_compliant_count"] for row in spend)
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Total Spend", f"${total_spend:,.2f}")
+    col2.metric("Receipts", total_receipts)
+    col3.metric("Non-Compliant", total_non_compliant)
+
+    # Spend breakdown
+    df = pd.DataFrame(spend)
+    df["group"] = df[group_by].astype(str).agg(" / ".join, axis=1)
+    st.bar_chart(df.set_index("group")["total_spend"])
+    st.dataframe(
+        df.drop(columns=["group"]).rename(columns={
+            "receipt_count": "Receipts",
+            "compliant_count": "Compliant",
+            "non_compliant_count": "Non-Compliant",
+            "total_spend": "Total Spend ($)",
+        }),
+        use_container_width=True,
+    )
+
+    # Top Violations
+    st.subheader("🚩 Top Violations")
+    violations = top_violations(limit=5, **filters)
+    if not violations:
+        st.write("No violations recorded.")
+    for idx, (violation, count) in enumerate(violations):
+        st.write(f"{idx+1}. {violation} ({count} times)")
+
+if __name__ == "__main__":
+    main()
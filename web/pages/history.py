@@ -0,0 +1,98 @@
+import os
+import sys
+import pandas as pd
+import streamlit as st
+
+# Add src directory to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from categories import Category
+from ledger import query_receipts, list_reports, load_report
+from report_generator import generate_expense_report
+
+def main():
+    st.title("🗂️ Receipt History")
+    st.write("Search every receipt processed across previous expense reports.")
+
+    # Filters
+    col1, col2 = st.columns(2)
+    with col1:
+        employee = st.text_input("👤 Employee", value="")
+    with col2:
+        merchant = st.text_input("🏪 Merchant", value="")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        category = st.selectbox("🏷️ Category", ["All"] + [c.value for c in Category])
+    with col2:
+        compliance = st.selectbox("✅ Compliance Status", ["All", "Compliant", "Non-Compliant"])
+
+    col1, col2 = st.columns(2)
+    with col1:
+        start_date = st.date_input("📅 From", value=None)
+    with col2:
+        end_date = st.date_input("📅 To", value=None)
+
+    receipts = query_receipts(
+        employee=employee or None,
+        merchant=merchant or None,
+        category=None if category == "All" else category,
+        is_compliant=None if compliance == "All" else compliance == "Compliant",
+        start_date=start_date.strftime('%Y-%m-%d') if start_date else None,
+        end_date=end_date.strftime('%Y-%m-%d') if end_date else None,
+        limit=500,
+    )
+
+    if receipts:
+        df = pd.DataFrame([
+            {
+                "Report": r["report_id"],
+                "Employee": r.get("employee") or "",
+                "Merchant": r.get("merchant", "Unknown"),
+                "Date": r.get("date", "Unknown"),
+                "Total Amount": r.get("total", 0.0),
+                "Category": r.get("category", "Other"),
+                "Compliance Status": "✅ Compliant" if r.get("is_compliant") else "❌ Non-Compliant",
+                "Violations": "\n".join(r.get("violations", [])) or "None",
+            }
+            for r in receipts
+        ])
+        st.dataframe(df, use_container_width=True)
+    else:
+        st.info("No receipts match the selected filters.")
+
+    st.subheader("📄 Previous Reports")
+    reports = list_reports()
+    if not reports:
+        st.info("No reports have been recorded yet.")
+        return
+
+    report_id = st.selectbox(
+        "Select a report",
+        [r["report_id"] for r in reports],
+        format_func=lambda rid: next(
+            f"{r['report_id']} — {r.get('requester') or 'Unknown'}" for r in reports if r["report_id"] == rid
+        ),
+    )
+
+    if st.button("🔁 Regenerate Report"):
+        header, report_receipts = load_report(report_id)
+        report_name = f"output/{report_id}_expense_report"
+
+        generate_expense_report(
+            [r for r in report_receipts if r.get("is_compliant")],
+            [r for r in report_receipts if not r.get("is_compliant")],
+            report_name,
+            header,
+        )
+
+        for report_path in (f"{report_name}.xlsx", f"{report_name}.pdf"):
+            with open(report_path, "rb") as f:
+                st.download_button(
+                    label=f"📥 Download {os.path.basename(report_path)}",
+                    data=f.read(),
+                    file_name=os.path.basename(report_path),
+                )
+
+if __name__ == "__main__":
+    main()